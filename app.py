@@ -1,8 +1,46 @@
+import os
+import time
+import uuid
+
 from flask import Flask, request, jsonify, render_template
-from test2 import recommend_places, ask_gemini
+from test2 import recommend_places, ask_gemini, is_follow_up, normalize_query, valid_place_ids
+from utils.concurrency import SingleFlight, AdmissionController, ServerBusy, metrics
 from utils.geocode import reverse_geocode
+from utils.session_store import get_session_store, is_valid_session_id
+
+COALESCE_BUCKET_SECONDS = int(os.getenv("COALESCE_BUCKET_SECONDS", 60))
 
 app = Flask(__name__)
+sessions = get_session_store()
+inflight = SingleFlight()
+admission = AdmissionController()
+
+BUSY_REPLY = "Burro is a little swamped right now 🐴💨 Give me a moment and ask again!"
+
+# 🔑 Identical queries from the same ~1km cell in the same time bucket share one pipeline run
+def coalesce_key(user_query, user_lat, user_lon, radius_km):
+    cell = (round(float(user_lat), 2), round(float(user_lon), 2)) if user_lat and user_lon else None
+    bucket = int(time.time() // COALESCE_BUCKET_SECONDS)
+    return (normalize_query(user_query), cell, radius_km, bucket)
+
+# 📍 Only geocode again if the user has moved
+def resolve_location(user_lat, user_lon, state):
+    if not (user_lat and user_lon):
+        return "Goa"
+    if state.get("coords") == [user_lat, user_lon] and state.get("location"):
+        return state["location"]
+    return reverse_geocode(user_lat, user_lon)
+
+# Runs inside admission (and coalescing), so shed requests never make network calls
+def run_pipeline(user_query, user_lat, user_lon, radius_km, state, candidate_ids=None, statuses=None):
+    location = resolve_location(user_lat, user_lon, state)
+    session = {
+        "location": location
+    }
+    statuses = dict(statuses or {})
+    places = recommend_places(user_query, user_lat, user_lon, radius_km, candidate_ids, statuses)
+    response = ask_gemini(user_query, places, session)
+    return places, response, statuses, location
 
 @app.route("/")
 def home():
@@ -15,25 +53,54 @@ def chat():
     user_lat = data.get("latitude")
     user_lon = data.get("longitude")
     radius_km = float(data.get("radius", 7))
+    session_id = data.get("session_id")
+    if not is_valid_session_id(session_id):
+        session_id = uuid.uuid4().hex
 
-    if user_lat and user_lon:
-        location = reverse_geocode(user_lat, user_lon)
-    else:
-        location = "Goa"
+    try:
+        state = sessions.get(session_id) or {}
+        shown_ids = valid_place_ids(state.get("candidate_ids"))
 
-    session = {
-        "location": location
-    }
+        # ♻️ Answer follow-ups from the previous result set, skipping retrieval
+        candidate_ids = None
+        statuses = {}
+        # Clients may say explicitly whether this is a follow-up; otherwise we guess
+        follow_up = data.get("follow_up")
+        if not isinstance(follow_up, bool):
+            follow_up = is_follow_up(user_query, shown_ids)
+        if shown_ids and follow_up:
+            candidate_ids = shown_ids
+            statuses = state.get("statuses", {})
 
-    try:
-        places = recommend_places(user_query, user_lat, user_lon, radius_km)
-        response = ask_gemini(user_query, places, session)
-        return jsonify({"reply": response})
+        metrics.inc("burro_pipeline_requests_total")
+        pipeline = lambda: run_pipeline(user_query, user_lat, user_lon, radius_km, state, candidate_ids, statuses)
+        if candidate_ids is None:
+            key = coalesce_key(user_query, user_lat, user_lon, radius_km)
+            places, response, statuses, location = inflight.do(key, lambda: admission.run(pipeline))
+        else:
+            # Follow-ups depend on this session's candidates, so they are never shared
+            places, response, statuses, location = admission.run(pipeline)
+        sessions.set(session_id, {
+            "location": location,
+            "coords": [user_lat, user_lon],
+            # Only a fresh retrieval replaces what the user was shown, so ordinals stay stable
+            "candidate_ids": candidate_ids if candidate_ids is not None else [p["place_id"] for p in places],
+            "statuses": statuses,
+        })
+        return jsonify({"reply": response, "session_id": session_id})
+    except ServerBusy as e:
+        print("🚦 Shedding load:", e)
+        return jsonify({"reply": BUSY_REPLY, "session_id": session_id, "busy": True}), 503, {"Retry-After": "5"}
     except Exception as e:
         print("💥 Error:", e)
         return jsonify({
-            "reply": "Oops! Something went wrong on Burro's side 🐴. Please try again later."
+            "reply": "Oops! Something went wrong on Burro's side 🐴. Please try again later.",
+            "session_id": session_id
         })
 
+@app.route("/metrics")
+def prometheus_metrics():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,191 @@
+"""Run logged queries through Burro offline.
+
+Reads one JSON object per line ({"id", "message", "latitude", "longitude",
+"radius", "location"}; only "message" is required) and appends one result per
+line to the output file. Queries whose id already has a successful result in
+the output are skipped, so an interrupted run can simply be restarted; failed
+ones are retried.
+
+Retrieval runs in the worker pool. In llm mode the Gemini calls are made from
+a thread pool in the parent process, so a single GeminiKeyManager tracks key
+usage; GEMINI_API_KEYS is only needed in that mode.
+
+    python batch.py queries.jsonl results.jsonl --workers 4 --mode retrieval
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_queries(path):
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                print(f"⚠️ Skipping malformed line {line_no}: {e}", file=sys.stderr)
+                continue
+            if not isinstance(record, dict):
+                print(f"⚠️ Skipping line {line_no}: expected a JSON object", file=sys.stderr)
+                continue
+            record.setdefault("id", line_no)
+            yield record
+
+
+def completed_ids(path):
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                if "error" not in result:
+                    done.add(result["id"])
+            except (ValueError, KeyError, TypeError):
+                continue  # Partially written line from an interrupted run
+    return done
+
+
+def silence_stdout(verbose):
+    # The pipeline prints debug output for every place; progress goes to stderr
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+
+
+def init_worker(verbose):
+    # Forked workers inherit the parent's torch thread pool size; with one
+    # worker per core that would oversubscribe the machine
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import torch
+    torch.set_num_threads(1)
+    silence_stdout(verbose)
+
+
+def process_query(record):
+    # Already loaded in the parent, so forked workers share the model and index
+    from test2 import recommend_places
+
+    user_query = record.get("message") or record.get("query", "")
+    result = {"id": record["id"], "query": user_query}
+    start = time.perf_counter()
+
+    try:
+        result["places"] = recommend_places(
+            user_query,
+            record.get("latitude"),
+            record.get("longitude"),
+            float(record.get("radius", 7)),
+        )
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    result["timings"] = {"retrieval_ms": retrieval_ms, "total_ms": retrieval_ms}
+    return record, result
+
+
+def answer_with_llm(record, result):
+    from test2 import ask_gemini
+
+    start = time.perf_counter()
+    try:
+        session = {"location": record.get("location", "Goa")}
+        result["reply"] = ask_gemini(result["query"], result["places"], session)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    llm_ms = (time.perf_counter() - start) * 1000
+    result["timings"]["llm_ms"] = llm_ms
+    result["timings"]["total_ms"] += llm_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk offline query processing for Burro.")
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("output", help="JSONL file to append results to")
+    parser.add_argument("--mode", choices=["retrieval", "llm"], default="retrieval",
+                        help="retrieval: recommend_places only; llm: also call Gemini (from this process)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=4)
+    parser.add_argument("--llm-threads", type=int, default=4, help="Concurrent Gemini calls in llm mode")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Results held in memory at once (default: 4 x workers x chunksize)")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's debug prints")
+    args = parser.parse_args(argv)
+
+    # Load the model + FAISS index once, before forking the workers
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    import test2  # noqa: F401
+    silence_stdout(args.verbose)
+
+    done = completed_ids(args.output)
+    if done:
+        print(f"⏩ Resuming — skipping {len(done)} completed queries", file=sys.stderr)
+
+    # Don't let the pool run ahead of the writer (or the Gemini threads)
+    slots = threading.Semaphore(args.max_pending or 4 * args.workers * args.chunksize)
+    stopping = threading.Event()
+
+    def pending():
+        for record in read_queries(args.input):
+            if record["id"] in done:
+                continue
+            # Runs on the pool's feeder thread; give up if the main loop has failed
+            while not slots.acquire(timeout=1):
+                if stopping.is_set():
+                    return
+            yield record
+
+    methods = mp.get_all_start_methods()
+    ctx = mp.get_context("fork" if "fork" in methods else None)
+    write_lock = threading.Lock()
+    counts = {"processed": 0, "failed": 0}
+    start = time.perf_counter()
+
+    with open(args.output, "a") as out:
+        def emit(result):
+            result["timings"] = {k: round(v, 2) for k, v in result["timings"].items()}
+            try:
+                with write_lock:
+                    out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                    out.flush()
+                    counts["processed"] += 1
+                    counts["failed"] += "error" in result
+                    if counts["processed"] % 100 == 0:
+                        print(f"📦 {counts['processed']} queries done", file=sys.stderr)
+            finally:
+                slots.release()
+
+        def finish_with_llm(record, result):
+            answer_with_llm(record, result)
+            emit(result)
+
+        futures = []
+        with ctx.Pool(args.workers, initializer=init_worker, initargs=(args.verbose,)) as pool, \
+                ThreadPoolExecutor(args.llm_threads) as llm_pool:
+            try:
+                for record, result in pool.imap_unordered(process_query, pending(), chunksize=args.chunksize):
+                    if args.mode == "llm" and "error" not in result:
+                        futures.append(llm_pool.submit(finish_with_llm, record, result))
+                    else:
+                        emit(result)
+            finally:
+                stopping.set()
+        for future in futures:
+            future.result()  # Surface write errors from the Gemini threads
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Processed {counts['processed']} queries ({counts['failed']} failed) in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,13 @@ import os
 import json
 from datetime import datetime
 from pathlib import Path
+import threading
+import time
+
+# Cached weather/opening status older than this (seconds) is recomputed
+STATUS_MAX_AGE = float(os.getenv("STATUS_MAX_AGE", 5 * 60))
+# Gemini calls slower than this (seconds) are abandoned so they can't hold a pipeline slot
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 30))
 
 # 📌 NEW: GeminiKeyManager for API rotation & usage tracking
 class GeminiKeyManager:
@@ -82,12 +89,73 @@ with open("index/places_meta.pkl", "rb") as f:
 def search_places(query, k=3):
     query_embedding = model.encode([query])
     distances, indices = index.search(query_embedding, k)
-    return [metadatas[i] for i in indices[0]]
+    return get_places_by_ids(indices[0])
+
+# 📦 Look up places by their index position (used as a stable place ID)
+def get_places_by_ids(place_ids):
+    return [{**metadatas[int(i)], "place_id": int(i)} for i in place_ids]
+
+# 🧽 Drop stored IDs that no longer exist (e.g. sessions saved before an index rebuild)
+def valid_place_ids(place_ids):
+    return [i for i in place_ids or [] if isinstance(i, int) and 0 <= i < len(metadatas)]
+
+# 🧹 Lowercase, strip punctuation and collapse whitespace
+def normalize_query(user_query):
+    return " ".join(re.sub(r'[^\w\s]', '', user_query.strip().lower()).split())
+
+# 💬 Follow-ups refer back to the previous answer instead of asking something new
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(they|them|those|these|that one|this one|that place|this place|same place|"
+    r"the (first|second|third|last)( one| place)?)\b"
+)
+ORDINAL_PATTERN = re.compile(r"\bthe (first|second|third|last)\b")
+ORDINALS = {"first": 0, "second": 1, "third": 2, "last": -1}
+
+# Naming any of these means the user has moved on to a new search
+PLACE_TYPES = {"cafe", "cafes", "bar", "bars", "pub", "pubs", "club", "clubs", "shack", "shacks",
+               "beach", "beaches", "bakery", "bakeries", "nightlife", "activities", "things to do"}
+CITIES = {p.get("city", "").strip().lower() for p in metadatas} | {"north goa", "south goa", "panaji"}
+CUISINES = {c.strip().lower() for p in metadatas for c in p.get("cuisines", [])} | {"seafood", "vegan", "vegetarian", "sushi"}
+CITIES.discard("")
+CUISINES.discard("")
+
+def _mentions(query, term):
+    return re.search(rf"\b{re.escape(term)}\b", query) is not None
+
+def is_follow_up(user_query, candidate_ids):
+    query = normalize_query(user_query)
+    if not candidate_ids or not FOLLOW_UP_PATTERN.search(query):
+        return False
+
+    # Areas and cuisines the previous places already cover don't count as new
+    known = set()
+    for place in get_places_by_ids(candidate_ids):
+        known.add(place.get("city", "").strip().lower())
+        known.update(c.strip().lower() for c in place.get("cuisines", []))
+    new_terms = (PLACE_TYPES | CITIES | CUISINES) - known
+    return not any(_mentions(query, term) for term in new_terms)
+
+# 👉 Candidates picked out by position ("the second one") or, if only one, by any back-reference
+def referenced_candidates(user_query, candidate_ids):
+    query = normalize_query(user_query)
+    if len(candidate_ids) == 1 and FOLLOW_UP_PATTERN.search(query):
+        return set(candidate_ids)
+    referenced = set()
+    for ordinal in ORDINAL_PATTERN.findall(query):
+        position = ORDINALS[ordinal]
+        if position < len(candidate_ids):
+            referenced.add(candidate_ids[position])
+    return referenced
 
 # 🔍 Main recommendation logic
-def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
+# Pass candidate_ids to re-filter a previous result set without hitting FAISS;
+# statuses (place_id -> weather/opening info) is reused while fresh and filled in place.
+def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7, candidate_ids=None, statuses=None):
     query = re.sub(r'[^\w\s]', '', user_query.strip().lower())
     print(f"[User Query] {query}")
+    if statuses is None:
+        statuses = {}
+    referenced_ids = referenced_candidates(user_query, candidate_ids) if candidate_ids else set()
 
     is_premium_query = any(x in query for x in ["premium", "fine dining", "luxury", "rich vibe", "expensive", "top-tier"])
     is_dish_query = any(word in query for word in ["serve", "get", "have", "eat", "dish", "try", "offer", "dishes", "menu"])
@@ -95,7 +163,12 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
 
     print(f"TEST: is_premium_query = {is_premium_query}, is_dish_query = {is_dish_query}, dish_keywords = {dish_keywords}")
 
-    raw_results = search_places(query)
+    if candidate_ids is not None:
+        print(f"♻️ Reusing cached candidates: {candidate_ids}")
+        # "the second one" narrows the follow-up to that place
+        raw_results = get_places_by_ids([i for i in candidate_ids if not referenced_ids or i in referenced_ids])
+    else:
+        raw_results = search_places(query)
     filtered = []
 
     print("\n📌 RAW RESULTS FROM FAISS + fallback:")
@@ -130,6 +203,7 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
             name_tokens.update(variant.lower().split())
 
         explicitly_mentioned = (
+            place['place_id'] in referenced_ids or
             any(v in query for v in variants) or
             any(fuzz.partial_ratio(query, v) > 85 for v in variants) or
             len(query_tokens.intersection(name_tokens)) >= 1
@@ -148,8 +222,11 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
 
         menu_hit = len(matched_dishes) > 0
 
-        # 🔁 Full fallback if explicitly mentioned
-        if is_dish_query and not menu_hit and explicitly_mentioned and menu_items:
+        # Places we just showed already passed the filters below, so keep them (with warnings)
+        keep_anyway = explicitly_mentioned or candidate_ids is not None
+
+        # 🔁 Full fallback if explicitly mentioned or just recommended
+        if is_dish_query and not menu_hit and keep_anyway and menu_items:
             matched_dishes = menu_items
             print(f"⚠️ Full menu returned for {name} due to explicit mention in dish query")
             menu_hit = True
@@ -158,7 +235,7 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
         print(f"TEST: cuisine_hit = {cuisine_hit}, menu_hit = {menu_hit}, matched_dishes = {matched_dishes}")
 
         if is_dish_query and not cuisine_hit and not menu_hit:
-            if explicitly_mentioned:
+            if keep_anyway:
                 print(f"⚠️ Keeping {name} — No menu match but user asked for dishes from this restaurant")
                 place['warning'] = f"I couldn’t find the exact dish names from {name}, but here’s what I know based on reviews or vibe!"
             else:
@@ -172,14 +249,24 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
                 print(f"📏 Skipping {name} — {distance:.1f}km > {radius_km}km")
                 continue
 
-        weather = get_current_weather(lat, lon)
+        status = statuses.get(str(place['place_id']))
+        if status is None or time.time() - status.get("computed_at", 0) > STATUS_MAX_AGE:
+            is_open, time_msg = is_place_open_now(timings)
+            status = {
+                "weather": get_current_weather(lat, lon),
+                "is_open": is_open,
+                "time_status": time_msg,
+                "computed_at": time.time(),
+            }
+            statuses[str(place['place_id'])] = status
+        weather = status["weather"]
+        is_open, time_msg = status["is_open"], status["time_status"]
         place['weather'] = weather
-        is_open, time_msg = is_place_open_now(timings)
         place['time_status'] = time_msg
         print(f"TEST: is_open = {is_open}, time_status = {time_msg}, weather = {weather}")
 
         if not is_open:
-            if explicitly_mentioned or (is_premium_query and is_premium):
+            if keep_anyway or (is_premium_query and is_premium):
                 print(f"⚠️ Keeping {name} — Closed but acceptable")
                 place['warning'] = f"{name} is currently closed. {time_msg}"
             else:
@@ -187,16 +274,16 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
                 place['warning'] = f"{name} is closed now. {time_msg}"
                 continue
 
-        if weather == "rainy" and outdoor and not explicitly_mentioned:
+        if weather == "rainy" and outdoor and not keep_anyway:
             print(f"⛔ Skipping {name} — Outdoor & Raining")
             place['warning'] = f"⚠️ Rain alert: {name} has outdoor seating and it’s currently raining."
             continue
-        elif weather == "rainy" and outdoor and explicitly_mentioned:
+        elif weather == "rainy" and outdoor and keep_anyway:
             print(f"⚠️ Keeping {name} — Raining but mentioned")
             place['warning'] = f"It’s raining there now 🌧️ and {name} has outdoor seating."
 
         print(f"TEST: is_premium = {is_premium}, explicitly_mentioned = {explicitly_mentioned}")
-        if is_premium_query and not is_premium and not explicitly_mentioned:
+        if is_premium_query and not is_premium and not keep_anyway:
             print(f"🚫 Skipping {name} — Not premium")
             continue
 
@@ -208,8 +295,16 @@ def recommend_places(user_query, user_lat=None, user_lon=None, radius_km=7):
 
 import google.generativeai as genai
 
-# 📌 Create key manager instance
-key_manager = GeminiKeyManager(daily_limit=2)
+# 📌 Key manager is created on first use, so retrieval-only callers don't need Gemini keys
+key_manager = None
+_key_lock = threading.Lock()
+
+def get_key_manager():
+    global key_manager
+    with _key_lock:
+        if key_manager is None:
+            key_manager = GeminiKeyManager(daily_limit=2)
+        return key_manager
 
 def ask_gemini(user_query, places, session):
     tone = session.get("tone", "friendly")
@@ -255,13 +350,14 @@ def ask_gemini(user_query, places, session):
         f"Places:\n" + "\n\n".join(formatted_places)
     )
 
-    genai.configure(api_key=key_manager.get_key())
-
-    try:
+    manager = get_key_manager()
+    # Count the call before making it so concurrent callers can't overrun a key's limit
+    with _key_lock:
+        genai.configure(api_key=manager.get_key())
         model = genai.GenerativeModel("gemini-2.5-flash")
-        response = model.generate_content(final_prompt)
-    finally:
-        key_manager.increment_usage()
+        manager.increment_usage()
+
+    response = model.generate_content(final_prompt, request_options={"timeout": GEMINI_TIMEOUT})
 
     return response.text.strip()
 
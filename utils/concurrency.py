@@ -0,0 +1,132 @@
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", 4))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", 16))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT", 10))  # seconds
+# Upper bound on one pipeline run: 3 weather lookups and a geocode (5s each) plus Gemini
+PIPELINE_TIMEOUT = float(os.getenv("PIPELINE_TIMEOUT", 60))  # seconds
+
+
+class ServerBusy(Exception):
+    pass
+
+
+# 📊 Counters and gauges exported on /metrics
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {
+            "burro_pipeline_requests_total": 0,
+            "burro_pipeline_coalescable_total": 0,
+            "burro_pipeline_coalesced_total": 0,
+            "burro_pipeline_shed_total": 0,
+        }
+        self.gauges = {
+            "burro_pipeline_inflight": 0,
+            "burro_pipeline_queue_depth": 0,
+        }
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            if name in self.counters:
+                self.counters[name] += amount
+            else:
+                self.gauges[name] += amount
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+        coalescable = counters["burro_pipeline_coalescable_total"]
+        coalesced = counters["burro_pipeline_coalesced_total"]
+        gauges["burro_pipeline_coalescing_ratio"] = coalesced / coalescable if coalescable else 0.0
+
+        lines = []
+        for name, value in counters.items():
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        for name, value in gauges.items():
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# 🔗 Concurrent calls with the same key share one execution
+class SingleFlight:
+    def __init__(self, timeout=QUEUE_TIMEOUT + PIPELINE_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> in-progress call
+
+    def do(self, key, fn):
+        metrics.inc("burro_pipeline_coalescable_total")
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+
+        if not leader:
+            metrics.inc("burro_pipeline_coalesced_total")
+            # Don't let a hung leader hold every waiting request's thread forever
+            if not call["done"].wait(self.timeout):
+                metrics.inc("burro_pipeline_shed_total")
+                raise ServerBusy("Timed out waiting for a shared pipeline run")
+        else:
+            try:
+                call["result"] = fn()
+            except Exception as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call["done"].set()
+
+        if call["error"] is not None:
+            if not leader and isinstance(call["error"], ServerBusy):
+                metrics.inc("burro_pipeline_shed_total")  # Every follower of a shed leader is shed too
+            raise call["error"]
+        return call["result"]
+
+
+# 🚦 Bounded in-flight work; shed load once the wait queue is full
+class AdmissionController:
+    def __init__(self, max_inflight=MAX_INFLIGHT, max_queue=MAX_QUEUE, timeout=QUEUE_TIMEOUT):
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def run(self, fn):
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                metrics.inc("burro_pipeline_shed_total")
+                raise ServerBusy("Admission queue is full")
+            self._waiting += 1
+        metrics.inc("burro_pipeline_queue_depth")
+
+        try:
+            admitted = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+            metrics.inc("burro_pipeline_queue_depth", -1)
+
+        if not admitted:
+            metrics.inc("burro_pipeline_shed_total")
+            raise ServerBusy("Timed out waiting for a pipeline slot")
+
+        metrics.inc("burro_pipeline_inflight")
+        try:
+            return fn()
+        finally:
+            metrics.inc("burro_pipeline_inflight", -1)
+            self._slots.release()
@@ -0,0 +1,149 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")  # memory | file | sqlite
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", ".burro_sessions")
+SESSION_TTL = float(os.getenv("SESSION_TTL", 30 * 60))  # seconds
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 1000))
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_session_id(session_id):
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.match(session_id) is not None
+
+
+# 🧠 In-memory store with LRU + TTL eviction
+class MemorySessionStore:
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # session_id -> (expires_at, state)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            expires_at, state = entry
+            if expires_at < time.time():
+                del self._entries[session_id]
+                return None
+            self._entries.move_to_end(session_id)
+            return state
+
+    def set(self, session_id, state):
+        with self._lock:
+            self._entries[session_id] = (time.time() + self.ttl, state)
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+
+# 📁 One JSON file per session in a local directory
+class FileSessionStore:
+    def __init__(self, path=SESSION_STORE_PATH, ttl=SESSION_TTL):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+    def _file(self, session_id):
+        # Session IDs come from clients, so never let them pick the path
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session ID: {session_id!r}")
+        return self.path / f"{session_id}.json"
+
+    def get(self, session_id):
+        if not is_valid_session_id(session_id):
+            return None
+        file = self._file(session_id)
+        with self._lock:
+            if not file.exists():
+                return None
+            try:
+                entry = json.loads(file.read_text())
+            except (OSError, ValueError):
+                return None
+            if entry["expires_at"] < time.time():
+                file.unlink(missing_ok=True)
+                return None
+            return entry["state"]
+
+    def set(self, session_id, state):
+        entry = {"expires_at": time.time() + self.ttl, "state": state}
+        with self._lock:
+            self._file(session_id).write_text(json.dumps(entry))
+
+    def delete(self, session_id):
+        if not is_valid_session_id(session_id):
+            return
+        with self._lock:
+            self._file(session_id).unlink(missing_ok=True)
+
+
+# 🗄️ SQLite-backed store, shared safely across worker threads
+class SqliteSessionStore:
+    def __init__(self, path=SESSION_STORE_PATH + ".db", ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, expires_at REAL, state TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, state FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] < time.time():
+                self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._conn.commit()
+                return None
+            return json.loads(row[1])
+
+    def set(self, session_id, state):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (session_id, time.time() + self.ttl, json.dumps(state)),
+            )
+            # Opportunistically drop expired sessions
+            self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+def get_session_store(kind=SESSION_STORE):
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "file":
+        return FileSessionStore()
+    if kind == "sqlite":
+        return SqliteSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE: {kind}")
@@ -17,7 +17,7 @@ def get_current_weather(lat=DEFAULT_LAT, lon=DEFAULT_LON):
             f"https://api.openweathermap.org/data/2.5/weather?"
             f"lat={lat}&lon={lon}&appid={API_KEY}&units=metric"
         )
-        response = requests.get(url)
+        response = requests.get(url, timeout=5)
         data = response.json()
         weather = data['weather'][0]['main'].lower()
 